@@ -1,21 +1,50 @@
 """
 Crew AI Agents for Instagram Content Creation
 """
+import functools
+from typing import List
 from crewai import Agent, Task
 from crewai.llm import LLM
+from pydantic import BaseModel
 from config import GOOGLE_API_KEY, MAX_CAPTION_LENGTH, HASHTAG_LIMIT
 
-# Initialize Google Gemini LLM using CrewAI's LLM class
-llm = LLM(
-    model="gemini/gemini-2.0-flash",
-    api_key=GOOGLE_API_KEY,
-    temperature=0.7
-)
+GEMINI_MODEL = "gemini/gemini-2.0-flash"
+
+# Roles of the agents whose task outputs are cached, so cache keys can be built without an agent
+RESEARCH_ROLE = "Research Specialist"
+IMAGE_PROMPT_ROLE = "Visual Content Strategist"
+
+class FastContentPackage(BaseModel):
+    """Structured content package produced by a single LLM call in fast mode"""
+    research: str
+    short_caption: str
+    long_caption: str
+    hashtags: List[str]
+    image_prompts: List[str]
+
+@functools.lru_cache(maxsize=1)
+def _get_llm() -> LLM:
+    """Initialize Google Gemini LLM using CrewAI's LLM class on first use"""
+    return LLM(
+        model=GEMINI_MODEL,
+        api_key=GOOGLE_API_KEY,
+        temperature=0.7
+    )
+
+@functools.lru_cache(maxsize=1)
+def _get_structured_llm() -> LLM:
+    """Initialize a Gemini LLM constrained to return a FastContentPackage as JSON"""
+    return LLM(
+        model=GEMINI_MODEL,
+        api_key=GOOGLE_API_KEY,
+        temperature=0.7,
+        response_format=FastContentPackage
+    )
 
 def create_research_agent():
     """Create the Research Agent"""
     return Agent(
-        role="Research Specialist",
+        role=RESEARCH_ROLE,
         goal="Gather comprehensive, accurate, and up-to-date information about the given topic",
         backstory="""You are an expert researcher with a keen eye for detail and a passion for finding 
         the most relevant and engaging information. You excel at identifying key trends, statistics, 
@@ -23,7 +52,7 @@ def create_research_agent():
         and provide well-structured, factual content.""",
         verbose=True,
         allow_delegation=False,
-        llm=llm
+        llm=_get_llm()
     )
 
 def create_content_writer_agent():
@@ -37,7 +66,7 @@ def create_content_writer_agent():
         short punchy captions and longer, more detailed posts that tell a story.""",
         verbose=True,
         allow_delegation=False,
-        llm=llm
+        llm=_get_llm()
     )
 
 def create_reviewer_agent():
@@ -51,13 +80,13 @@ def create_reviewer_agent():
         maintaining brand voice and ensuring content aligns with marketing objectives.""",
         verbose=True,
         allow_delegation=False,
-        llm=llm
+        llm=_get_llm()
     )
 
 def create_image_prompt_agent():
     """Create the Image Prompt Generator Agent"""
     return Agent(
-        role="Visual Content Strategist",
+        role=IMAGE_PROMPT_ROLE,
         goal="Create detailed, compelling image prompts that will generate visually stunning and relevant images for Instagram",
         backstory="""You are a visual content strategist with deep understanding of visual storytelling and 
         Instagram aesthetics. You know how to craft detailed prompts that will generate images that are 
@@ -65,13 +94,12 @@ def create_image_prompt_agent():
         composition, lighting, mood, and style that works well on social media platforms.""",
         verbose=True,
         allow_delegation=False,
-        llm=llm
+        llm=_get_llm()
     )
 
-def create_research_task(topic: str, research_agent: Agent):
-    """Create the research task"""
-    return Task(
-        description=f"""
+def research_task_description(topic: str) -> str:
+    """Build the research task description for a topic"""
+    return f"""
         Research the topic: "{topic}"
         
         Your research should include:
@@ -88,7 +116,12 @@ def create_research_task(topic: str, research_agent: Agent):
         - Easy to understand in social media format
         
         Provide a comprehensive research summary with clear sections and bullet points.
-        """,
+        """
+
+def create_research_task(topic: str, research_agent: Agent):
+    """Create the research task"""
+    return Task(
+        description=research_task_description(topic),
         agent=research_agent,
         expected_output="A detailed research summary with key facts, trends, and insights about the topic, formatted for easy consumption by content creators."
     )
@@ -160,10 +193,9 @@ def create_review_task(reviewer_agent: Agent):
         expected_output="Final polished Instagram content with all improvements applied."
     )
 
-def create_image_prompt_task(topic: str, image_prompt_agent: Agent):
-    """Create the image prompt generation task"""
-    return Task(
-        description=f"""
+def image_prompt_task_description(topic: str) -> str:
+    """Build the image prompt generation task description for a topic"""
+    return f"""
         Create 3 detailed image prompts for the topic: "{topic}"
         
         Each prompt should be:
@@ -183,7 +215,39 @@ def create_image_prompt_task(topic: str, image_prompt_agent: Agent):
         - Instagram aesthetic appeal
         
         Format each prompt as a detailed description that could be used with any text-to-image AI.
-        """,
+        """
+
+def create_image_prompt_task(topic: str, image_prompt_agent: Agent):
+    """Create the image prompt generation task"""
+    return Task(
+        description=image_prompt_task_description(topic),
         agent=image_prompt_agent,
         expected_output="Three detailed image prompts optimized for Instagram content, each offering a unique visual perspective on the topic."
     )
+
+def adapt_cached_output(cached_output: str, cached_topic: str, topic: str, role: str) -> str:
+    """Adapt a task output produced for a similar topic to a new topic with a single LLM call"""
+    prompt = f"""
+    You are acting as the {role}. The following output was produced for the topic "{cached_topic}".
+    Adapt it to the topic "{topic}": keep the same structure and format, keep facts that still apply,
+    and rewrite or replace anything specific to the original topic.
+    
+    {cached_output}
+    """
+    return _get_llm().call([{"role": "user", "content": prompt}])
+
+def create_fast_content(topic: str) -> dict:
+    """Create a complete Instagram content package for a topic with a single structured LLM call"""
+    prompt = f"""
+    Create an Instagram content package for the topic: "{topic}"
+    
+    Provide:
+    - research: a short summary of key facts, trends and insights about the topic
+    - short_caption: a caption under 150 characters with a hook, key message and call-to-action
+    - long_caption: a caption under {MAX_CAPTION_LENGTH} characters with an engaging opening,
+      key points from the research and a call-to-action, using emojis appropriately
+    - hashtags: up to {HASHTAG_LIMIT} relevant hashtags, each starting with #
+    - image_prompts: 3 detailed, diverse text-to-image prompts optimized for Instagram
+    """
+    response = _get_structured_llm().call([{"role": "user", "content": prompt}])
+    return FastContentPackage.model_validate_json(response).model_dump()
@@ -1,33 +1,170 @@
 """
 Image generation module using external APIs
 """
-import requests
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.retry import Retry
+import asyncio
+import os
+import shutil
+import threading
 import base64
-import json
-from typing import List, Dict
-import random
+import hashlib
+import orjson
+from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from uuid import uuid4
 from config import NANO_BANANA_API_KEY, SEGMIND_API_KEY, STABILITY_API_KEY, IMAGE_GENERATION_API
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+REQUEST_TIMEOUT = 30  # seconds, so a stalled API call cannot hang the pipeline
+HTTP_CACHE_PATH = os.path.join("cache", "http_cache")
+POST_RETRY_STATUSES = (429, 503)  # the API refused the request, so resending cannot double-bill
+
+def _nano_banana_payload(prompt: str, num_images: int) -> Dict:
+    """Build the Nano Banana request body for a single prompt"""
+    return {
+        "model": "nano-banana-v1",
+        "prompt": prompt,
+        "n": num_images,
+        "size": "1024x1024",
+        "quality": "hd"
+    }
+
+def _segmind_payload(prompt: str, num_images: int) -> Dict:
+    """Build the Segmind request body for a single prompt"""
+    return {
+        "prompt": prompt,
+        "num_inference_steps": 20,
+        "guidance_scale": 7.5,
+        "width": 1024,
+        "height": 1024,
+        "num_images": num_images
+    }
+
+def _stability_payload(prompt: str, num_images: int) -> Dict:
+    """Build the Stability AI request body for a single prompt"""
+    return {
+        "text_prompts": [{"text": prompt}],
+        "cfg_scale": 7,
+        "height": 1024,
+        "width": 1024,
+        "samples": num_images,
+        "steps": 30
+    }
+
+# Per-API request settings, resolved once per ImageGenerator instead of on every prompt.
+# Each response parser turns the JSON body into the image fields ("url" or "base64").
+_API_CONFIG = {
+    "nano_banana": {
+        "name": "Nano Banana",
+        "url": "https://api.nanobanana.ai/v1/images/generations",
+        "api_key": NANO_BANANA_API_KEY,
+        "auth_header": ("Authorization", "Bearer {key}"),
+        "payload_builder": _nano_banana_payload,
+        "response_parser": lambda data: [{"url": img.get("url")} for img in data.get("data", [])]
+    },
+    "segmind": {
+        "name": "Segmind",
+        "url": "https://api.segmind.com/v1/sdxl1.0-txt2img",
+        "api_key": SEGMIND_API_KEY,
+        "auth_header": ("x-api-key", "{key}"),
+        "payload_builder": _segmind_payload,
+        # Segmind returns base64 encoded images
+        "response_parser": lambda data: [{"base64": img_b64} for img_b64 in data.get("images", [])]
+    },
+    "stability": {
+        "name": "Stability AI",
+        "url": "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
+        "api_key": STABILITY_API_KEY,
+        "auth_header": ("Authorization", "Bearer {key}"),
+        "payload_builder": _stability_payload,
+        "response_parser": lambda data: [{"base64": img.get("base64")} for img in data.get("artifacts", [])]
+    }
+}
+
+class _ImageApiRetry(Retry):
+    """Retry policy that only resends a generation POST when the API explicitly refused it
+
+    Generation POSTs are billed and not idempotent, so timeouts and 5xx errors are never
+    replayed for them; 429/503 mean the request was rejected and honour Retry-After.
+    GETs use the standard status_forcelist behaviour.
+    """
+    
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method == "POST":
+            return status_code in POST_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
 class ImageGenerator:
     """Handles image generation using various external APIs"""
     
     def __init__(self, api_type: str = IMAGE_GENERATION_API):
         self.api_type = api_type
-        self.api_key = self._get_api_key()
-    
-    def _get_api_key(self) -> str:
-        """Get the appropriate API key based on the selected service"""
-        if self.api_type == "nano_banana":
-            return NANO_BANANA_API_KEY
-        elif self.api_type == "segmind":
-            return SEGMIND_API_KEY
-        elif self.api_type == "stability":
-            return STABILITY_API_KEY
-        elif self.api_type == "pollinations":
+        # The HTTP session (and its on-disk cache) is created on first use, so URL-only
+        # generation such as Pollinations without saving touches neither network nor disk
+        self._http_session: Optional[CachedSession] = None
+        self._session_lock = threading.Lock()
+        
+        # Successful results per (prompt, num_images), so repeated prompts aren't paid for twice
+        self._generated: Dict[tuple, List[Dict]] = {}
+        self._generated_lock = threading.Lock()
+        
+        if api_type == "pollinations":
             # Pollinations is a free, keyless image generation service
-            return ""
-        else:
-            raise ValueError(f"Unsupported API type: {self.api_type}")
+            self.api_key = ""
+            return
+        
+        if api_type not in _API_CONFIG:
+            raise ValueError(f"Unsupported API type: {api_type}")
+        
+        api_config = _API_CONFIG[api_type]
+        self.api_key = api_config["api_key"]
+        self._api_name = api_config["name"]
+        self._url = api_config["url"]
+        header_name, header_value = api_config["auth_header"]
+        self._headers = {
+            header_name: header_value.format(key=self.api_key),
+            "Content-Type": "application/json"
+        }
+        self._payload_builder = api_config["payload_builder"]
+        self._response_parser = api_config["response_parser"]
+    
+    @property
+    def _session(self) -> CachedSession:
+        """Shared HTTP session, created on first use"""
+        with self._session_lock:
+            if self._http_session is None:
+                self._http_session = self._create_session()
+        return self._http_session
+    
+    def _create_session(self) -> CachedSession:
+        """Create the pooled, retrying and caching session used for all API calls"""
+        # TCP/TLS connections are pooled and transient failures retried.
+        # Successful generation POSTs are cached on disk, so repeated prompts skip the network.
+        # Image download GETs are not cached: they stream straight to disk, and files that
+        # are already saved are reused by save_images instead.
+        session = CachedSession(
+            HTTP_CACHE_PATH,
+            expire_after=86400,
+            allowable_methods=("POST",),
+            match_headers=False
+        )
+        session.cache.delete(expired=True)
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=_ImageApiRetry(
+                total=2,
+                read=0,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+        )
+        session.mount("https://", adapter)
+        return session
     
     def generate_images(self, prompts: List[str], num_images: int = 3) -> List[Dict]:
         """
@@ -40,16 +177,11 @@ class ImageGenerator:
         Returns:
             List of dictionaries containing image data and metadata
         """
-        if self.api_type == "nano_banana":
-            return self._generate_nano_banana(prompts, num_images)
-        elif self.api_type == "segmind":
-            return self._generate_segmind(prompts, num_images)
-        elif self.api_type == "stability":
-            return self._generate_stability(prompts, num_images)
-        elif self.api_type == "pollinations":
+        if self.api_type == "pollinations":
             return self._generate_pollinations(prompts, num_images)
-        else:
-            raise ValueError(f"Unsupported API type: {self.api_type}")
+        
+        # Each prompt is an independent, network-bound request, so issue them concurrently
+        return self._generate_concurrently(prompts, num_images)
 
     def _generate_pollinations(self, prompts: List[str], num_images: int) -> List[Dict]:
         """Generate images using Pollinations (free, keyless) by returning image URLs.
@@ -62,9 +194,11 @@ class ImageGenerator:
         base_url = "https://image.pollinations.ai/prompt/"
 
         for prompt in prompts:
-            # Generate multiple image URLs with different seeds for variety
-            for _ in range(max(1, num_images)):
-                seed = random.randint(1, 10_000_000)
+            # Generate multiple image URLs with different seeds for variety. Seeds are derived
+            # from the prompt so the same request maps to the same (cacheable) URL.
+            for i in range(max(1, num_images)):
+                seed_digest = hashlib.blake2b(f"{prompt}:{i}".encode("utf-8"), digest_size=4).digest()
+                seed = int.from_bytes(seed_digest, "big") % 10_000_000 + 1
                 query_suffix = f"?width=1024&height=1024&enhance=true&seed={seed}"
                 url = f"{base_url}{quote(prompt)}{query_suffix}"
                 images.append({
@@ -75,135 +209,80 @@ class ImageGenerator:
 
         return images
     
-    def _generate_nano_banana(self, prompts: List[str], num_images: int) -> List[Dict]:
-        """Generate images using Nano Banana API"""
-        images = []
+    def _generate_concurrently(self, prompts: List[str], num_images: int) -> List[Dict]:
+        """Fan the per-prompt API calls out over a thread pool and flatten the results"""
+        if not prompts:
+            return []
         
-        for prompt in prompts:
-            try:
-                url = "https://api.nanobanana.ai/v1/images/generations"
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                payload = {
-                    "model": "nano-banana-v1",
-                    "prompt": prompt,
-                    "n": num_images,
-                    "size": "1024x1024",
-                    "quality": "hd"
-                }
-                
-                response = requests.post(url, headers=headers, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
-                for img_data in data.get("data", []):
-                    images.append({
-                        "prompt": prompt,
-                        "url": img_data.get("url"),
-                        "api": "nano_banana"
-                    })
-                    
-            except Exception as e:
-                print(f"Error generating image with Nano Banana: {e}")
-                # Fallback to a placeholder
-                images.append({
-                    "prompt": prompt,
-                    "url": None,
-                    "error": str(e),
-                    "api": "nano_banana"
-                })
+        with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+            results = list(executor.map(lambda prompt: self._generate_single(prompt, num_images), prompts))
+        
+        return [image for prompt_images in results for image in prompt_images]
+    
+    def _generate_single(self, prompt: str, num_images: int) -> List[Dict]:
+        """Generate images for a single prompt, reusing earlier successful results for the same request"""
+        key = (prompt, num_images)
+        with self._generated_lock:
+            if key in self._generated:
+                return self._generated[key]
         
+        images = self._post_one(prompt, num_images)
+        # Failed requests are not memoized so they can be retried
+        if not any(img.get("error") for img in images):
+            with self._generated_lock:
+                self._generated[key] = images
         return images
     
-    def _generate_segmind(self, prompts: List[str], num_images: int) -> List[Dict]:
-        """Generate images using Segmind API"""
+    def _post_one(self, prompt: str, num_images: int) -> List[Dict]:
+        """Generate images for a single prompt with the configured API"""
         images = []
         
-        for prompt in prompts:
-            try:
-                url = "https://api.segmind.com/v1/sdxl1.0-txt2img"
-                headers = {
-                    "x-api-key": self.api_key,
-                    "Content-Type": "application/json"
-                }
-                
-                payload = {
-                    "prompt": prompt,
-                    "num_inference_steps": 20,
-                    "guidance_scale": 7.5,
-                    "width": 1024,
-                    "height": 1024,
-                    "num_images": num_images
-                }
-                
-                response = requests.post(url, headers=headers, json=payload)
-                response.raise_for_status()
-                
-                # Segmind returns base64 encoded images
-                data = response.json()
-                for i, img_b64 in enumerate(data.get("images", [])):
-                    images.append({
-                        "prompt": prompt,
-                        "base64": img_b64,
-                        "api": "segmind"
-                    })
-                    
-            except Exception as e:
-                print(f"Error generating image with Segmind: {e}")
+        try:
+            response = self._session.post(
+                self._url,
+                headers=self._headers,
+                json=self._payload_builder(prompt, num_images),
+                timeout=REQUEST_TIMEOUT
+            )
+            response.raise_for_status()
+            
+            for img_data in self._response_parser(orjson.loads(response.content)):
                 images.append({
                     "prompt": prompt,
-                    "url": None,
-                    "error": str(e),
-                    "api": "segmind"
+                    **img_data,
+                    "api": self.api_type
                 })
+                
+        except Exception as e:
+            print(f"Error generating image with {self._api_name}: {e}")
+            # Fallback to a placeholder
+            images.append({
+                "prompt": prompt,
+                "url": None,
+                "error": str(e),
+                "api": self.api_type
+            })
         
         return images
     
-    def _generate_stability(self, prompts: List[str], num_images: int) -> List[Dict]:
-        """Generate images using Stability AI API"""
-        images = []
+    async def generate_images_async(self, prompts: List[str], num_images: int = 3) -> List[Dict]:
+        """
+        Asynchronous variant of generate_images for callers running an event loop
         
-        for prompt in prompts:
-            try:
-                url = "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image"
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                payload = {
-                    "text_prompts": [{"text": prompt}],
-                    "cfg_scale": 7,
-                    "height": 1024,
-                    "width": 1024,
-                    "samples": num_images,
-                    "steps": 30
-                }
-                
-                response = requests.post(url, headers=headers, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
-                for img_data in data.get("artifacts", []):
-                    images.append({
-                        "prompt": prompt,
-                        "base64": img_data.get("base64"),
-                        "api": "stability"
-                    })
-                    
-            except Exception as e:
-                print(f"Error generating image with Stability AI: {e}")
-                images.append({
-                    "prompt": prompt,
-                    "url": None,
-                    "error": str(e),
-                    "api": "stability"
-                })
+        Args:
+            prompts: List of text prompts for image generation
+            num_images: Number of images to generate per prompt
+            
+        Returns:
+            List of dictionaries containing image data and metadata
+        """
+        if self.api_type == "pollinations":
+            return self._generate_pollinations(prompts, num_images)
         
-        return images
+        results = await asyncio.gather(*(
+            asyncio.to_thread(self._generate_single, prompt, num_images) for prompt in prompts
+        ))
+        return [image for prompt_images in results for image in prompt_images]
     
     def save_images(self, images: List[Dict], output_dir: str = "generated_images") -> List[str]:
         """
@@ -216,38 +295,88 @@ class ImageGenerator:
         Returns:
             List of saved file paths
         """
-        import os
-        from PIL import Image
-        import io
+        os.makedirs(output_dir, exist_ok=True)
+        if not images:
+            return []
+        
+        # Downloads are network-bound, so run them concurrently; map preserves the image order
+        with ThreadPoolExecutor(max_workers=min(8, len(images))) as executor:
+            results = executor.map(self._save_one, range(len(images)), images, repeat(output_dir))
+            saved_paths = [filepath for filepath in results if filepath]
+        
+        return saved_paths
+    
+    async def save_images_async(self, images: List[Dict], output_dir: str = "generated_images") -> List[str]:
+        """
+        Asynchronous variant of save_images that downloads and writes all images concurrently
         
+        Args:
+            images: List of image data dictionaries
+            output_dir: Directory to save images
+            
+        Returns:
+            List of saved file paths
+        """
         os.makedirs(output_dir, exist_ok=True)
-        saved_paths = []
+        results = await asyncio.gather(*(
+            asyncio.to_thread(self._save_one, i, img_data, output_dir)
+            for i, img_data in enumerate(images)
+        ))
+        return [filepath for filepath in results if filepath]
+    
+    def _save_one(self, index: int, img_data: Dict, output_dir: str) -> Optional[str]:
+        """Save a single image to disk, returning its path or None if it could not be saved"""
+        from PIL import Image
+        import io
         
-        for i, img_data in enumerate(images):
-            try:
-                if img_data.get("base64"):
-                    # Decode base64 image
-                    img_bytes = base64.b64decode(img_data["base64"])
+        try:
+            if img_data.get("base64"):
+                # Decode base64 image
+                img_bytes = base64.b64decode(img_data["base64"], validate=False)
+                
+                filename = f"image_{index+1}_{img_data['api']}.png"
+                filepath = os.path.join(output_dir, filename)
+                if img_bytes[:8] == PNG_SIGNATURE:
+                    # Already a PNG, so write the decoded bytes as-is
+                    Path(filepath).write_bytes(img_bytes)
+                else:
                     img = Image.open(io.BytesIO(img_bytes))
-                    
-                    filename = f"image_{i+1}_{img_data['api']}.png"
-                    filepath = os.path.join(output_dir, filename)
-                    img.save(filepath)
-                    saved_paths.append(filepath)
-                    
-                elif img_data.get("url"):
-                    # Download image from URL
-                    response = requests.get(img_data["url"])
-                    response.raise_for_status()
-                    
-                    img = Image.open(io.BytesIO(response.content))
-                    filename = f"image_{i+1}_{img_data['api']}.png"
-                    filepath = os.path.join(output_dir, filename)
                     img.save(filepath)
-                    saved_paths.append(filepath)
-                    
-            except Exception as e:
-                print(f"Error saving image {i+1}: {e}")
-                continue
+                return filepath
+                
+            elif img_data.get("url"):
+                # Name URL images after the URL itself; the same URL (e.g. a Pollinations
+                # prompt + seed) always yields the same image, so existing files are reused
+                url_digest = hashlib.blake2b(img_data["url"].encode("utf-8"), digest_size=8).hexdigest()
+                filename = f"image_{url_digest}_{img_data['api']}.png"
+                filepath = os.path.join(output_dir, filename)
+                if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+                    return filepath
+                
+                # Download image from URL into a uniquely named temporary file, so an interrupted
+                # download is never mistaken for a complete image and duplicate URLs don't collide
+                tmp_path = f"{filepath}.{uuid4().hex}.tmp"
+                try:
+                    with open(tmp_path, "xb") as f, \
+                            self._session.get(img_data["url"], stream=True, timeout=REQUEST_TIMEOUT) as response:
+                        response.raise_for_status()
+                        
+                        content_type = response.headers.get("Content-Type", "")
+                        if content_type.startswith("image/png"):
+                            # Already a PNG, so stream the bytes straight to disk without re-encoding
+                            response.raw.decode_content = True
+                            shutil.copyfileobj(response.raw, f, length=64 * 1024)
+                        else:
+                            # Other formats still need converting to PNG
+                            img = Image.open(io.BytesIO(response.content))
+                            img.save(f, format="PNG")
+                    os.replace(tmp_path, filepath)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                return filepath
+                
+        except Exception as e:
+            print(f"Error saving image {index+1}: {e}")
         
-        return saved_paths
+        return None
@@ -10,84 +10,148 @@ from agents import (
     create_research_task,
     create_writing_task,
     create_review_task,
-    create_image_prompt_task
+    create_image_prompt_task,
+    research_task_description,
+    image_prompt_task_description,
+    RESEARCH_ROLE,
+    IMAGE_PROMPT_ROLE,
+    adapt_cached_output,
+    create_fast_content
 )
 from image_generator import ImageGenerator
+from semantic_cache import SemanticCache, TaskCache, embed_text
 from config import NUM_IMAGES
-import json
+import orjson
+import hashlib
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import cached_property
+from pathlib import Path
+from typing import Callable, Optional
+
+_SHORT_CAPTION_FALLBACK = "Check the full content for short caption"
+_HASHTAG_RE = re.compile(r'#\w+')
+_SHORT_CAPTION_RE = re.compile(r'SHORT CAPTION|SHORT:', re.IGNORECASE)
+_LONG_CAPTION_RE = re.compile(r'LONG CAPTION|LONG:', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+_PROMPT_RE = re.compile(r'^[ \t]*(?:[-•][ \t]*)?(?:\d+[ \t]*[.)\-:][ \t]*)?(?P<body>\S.*)$', re.MULTILINE)
 
 class InstagramContentCrew:
     """Main class for managing the Instagram content creation workflow"""
     
-    def __init__(self):
-        self.research_agent = create_research_agent()
-        self.writer_agent = create_content_writer_agent()
-        self.reviewer_agent = create_reviewer_agent()
-        self.image_prompt_agent = create_image_prompt_agent()
-        self.image_generator = ImageGenerator()
-        
-    def create_content(self, topic: str, save_images: bool = True) -> dict:
+    # Agents, the image generator and the caches are built on first use so that
+    # constructing the crew stays cheap; the research and image prompt agents are
+    # only created when their output can't be adapted from the task cache
+    @cached_property
+    def research_agent(self):
+        return create_research_agent()
+    
+    @cached_property
+    def writer_agent(self):
+        return create_content_writer_agent()
+    
+    @cached_property
+    def reviewer_agent(self):
+        return create_reviewer_agent()
+    
+    @cached_property
+    def image_prompt_agent(self):
+        return create_image_prompt_agent()
+    
+    @cached_property
+    def image_generator(self) -> ImageGenerator:
+        return ImageGenerator()
+    
+    @cached_property
+    def semantic_cache(self) -> SemanticCache:
+        return SemanticCache()
+    
+    @cached_property
+    def task_cache(self) -> TaskCache:
+        return TaskCache()
+    
+    def create_content(self, topic: str, save_images: bool = True, fast_mode: bool = False,
+                       save_result: bool = True) -> dict:
         """
         Create complete Instagram content for a given topic
         
         Args:
             topic: The topic to create content about
             save_images: Whether to save generated images to disk
+            fast_mode: Produce the content with a single LLM call instead of the full crew
+            save_result: Whether to write the content package to the results directory
             
         Returns:
             Dictionary containing all generated content
         """
         print(f"Starting Instagram content creation for topic: '{topic}'")
         
+        if fast_mode:
+            return self._create_fast_content(topic, save_images, save_result)
+        
+        # Reuse the content package of a semantically similar topic before any LLM traffic
+        topic_embedding = embed_text(topic)
+        cached_result = self.semantic_cache.lookup(topic_embedding)
+        if cached_result is not None:
+            print("Found cached content for a similar topic, skipping the crew run")
+            cached_result["topic"] = topic
+            cached_result["created_at"] = datetime.now().isoformat()
+            
+            # Saved paths from the original run may be stale, so save the images again if asked
+            cached_result["saved_image_paths"] = []
+            if save_images and cached_result["generated_images"]:
+                cached_result["saved_image_paths"] = self.image_generator.save_images(cached_result["generated_images"])
+                print(f"Saved {len(cached_result['saved_image_paths'])} images to disk")
+            return cached_result
+        
+        # Adapt research cached for a similar topic instead of re-running the research agent
+        research_result = self._adapt_cached_output(RESEARCH_ROLE, research_task_description, topic, topic_embedding)
+        
         # Create tasks
-        research_task = create_research_task(topic, self.research_agent)
+        research_task = None
+        if research_result is None:
+            research_task = create_research_task(topic, self.research_agent)
         writing_task = create_writing_task(self.writer_agent)
         review_task = create_review_task(self.reviewer_agent)
-        image_prompt_task = create_image_prompt_task(topic, self.image_prompt_agent)
         
         # Update task contexts
-        writing_task.context = [research_task]
+        content_tasks = []
+        if research_task is not None:
+            content_tasks.append(research_task)
+            writing_task.context = [research_task]
+        else:
+            writing_task.description += f"\nResearch to use:\n{research_result}\n"
         review_task.context = [writing_task]
+        content_tasks.extend([writing_task, review_task])
         
-        # Create and run the crew
-        crew = Crew(
-            agents=[
-                self.research_agent,
-                self.writer_agent, 
-                self.reviewer_agent,
-                self.image_prompt_agent
-            ],
-            tasks=[
-                research_task,
-                writing_task,
-                review_task,
-                image_prompt_task
-            ],
-            process=Process.sequential,
-            verbose=True
-        )
-        
+        # Image prompts only depend on the topic, so the visual branch (prompts, then image
+        # generation) runs concurrently with the research -> writing -> review chain
         print("Running content creation workflow...")
-        result = crew.kickoff()
+        executor = ThreadPoolExecutor(max_workers=1)
+        cancelled = threading.Event()
+        visual_future = executor.submit(self._create_images, topic, topic_embedding, cancelled)
+        try:
+            self._build_crew(content_tasks).kickoff()
+        except Exception:
+            # Surface the failure right away instead of waiting for (and paying for) images
+            # whose content is being discarded; the branch stops before calling the image API
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        try:
+            image_prompts, generated_images = visual_future.result()
+        finally:
+            executor.shutdown()
         
         # Extract results from each task
-        research_result = str(research_task.output)
+        if research_task is not None:
+            research_result = str(research_task.output)
+            self._cache_task_output(RESEARCH_ROLE, research_task_description, topic, topic_embedding, research_result)
         writing_result = str(writing_task.output)
         review_result = str(review_task.output)
-        image_prompts_result = str(image_prompt_task.output)
-        
-        print("Generating images...")
-        
-        # Parse image prompts from the result
-        image_prompts = self._parse_image_prompts(image_prompts_result, topic)
-        
-        # Generate images
-        generated_images = self.image_generator.generate_images(
-            image_prompts, 
-            num_images=1  # 1 image per prompt
-        )
         
         # Save images if requested
         saved_image_paths = []
@@ -110,33 +174,144 @@ class InstagramContentCrew:
             "saved_image_paths": saved_image_paths
         }
         
-        # Save result to file
-        self._save_result(final_result, topic)
+        # Save result to file and cache it for similar topics. Packages with failed images or
+        # unparsed captions are not cached, so similar topics retry instead of reusing them.
+        if save_result:
+            self._save_result(final_result, topic)
+        if self._is_complete(final_result):
+            self.semantic_cache.store(topic, topic_embedding, final_result)
+        
+        print("Instagram content creation completed!")
+        return final_result
+    
+    def _is_complete(self, result: dict) -> bool:
+        """Whether a content package is good enough to be reused for similar topics"""
+        if any(img.get("error") for img in result["generated_images"]):
+            return False
+        return result["content"]["short_caption"] != _SHORT_CAPTION_FALLBACK
+    
+    def _create_fast_content(self, topic: str, save_images: bool, save_result: bool) -> dict:
+        """Create content with one structured LLM call, skipping the crew, the caches and paid image APIs"""
+        print("Running fast content creation with a single LLM call...")
+        package = create_fast_content(topic)
+        image_prompts = [prompt.strip() for prompt in package["image_prompts"] if prompt.strip()]
+        image_prompts = self._pad_image_prompts(image_prompts, topic)
+        
+        # Pollinations only builds image URLs, so generation costs no API calls
+        image_generator = ImageGenerator(api_type="pollinations")
+        generated_images = image_generator.generate_images(image_prompts, num_images=1)
+        
+        saved_image_paths = []
+        if save_images and generated_images:
+            saved_image_paths = image_generator.save_images(generated_images)
+            print(f"Saved {len(saved_image_paths)} images to disk")
+        
+        final_result = {
+            "topic": topic,
+            "created_at": datetime.now().isoformat(),
+            "research": package["research"],
+            "content": {
+                "short_caption": package["short_caption"],
+                "long_caption": package["long_caption"],
+                "hashtags": package["hashtags"][:30]
+            },
+            "image_prompts": image_prompts,
+            "generated_images": generated_images,
+            "saved_image_paths": saved_image_paths
+        }
+        
+        if save_result:
+            self._save_result(final_result, topic)
         
         print("Instagram content creation completed!")
         return final_result
     
+    def _create_images(self, topic: str, topic_embedding, cancelled: threading.Event) -> tuple:
+        """Produce image prompts (adapted from the cache or via the visual crew) and generate images"""
+        image_prompts_result = self._adapt_cached_output(IMAGE_PROMPT_ROLE, image_prompt_task_description, topic, topic_embedding)
+        if image_prompts_result is None:
+            image_prompt_task = create_image_prompt_task(topic, self.image_prompt_agent)
+            self._build_crew([image_prompt_task]).kickoff()
+            image_prompts_result = str(image_prompt_task.output)
+            self._cache_task_output(IMAGE_PROMPT_ROLE, image_prompt_task_description, topic, topic_embedding, image_prompts_result)
+        
+        # Parse image prompts from the result
+        image_prompts = self._parse_image_prompts(image_prompts_result, topic)
+        
+        # The content crew failed, so don't spend paid image API calls on a discarded run
+        if cancelled.is_set():
+            return image_prompts, []
+        
+        print("Generating images...")
+        
+        # Generate images
+        generated_images = self.image_generator.generate_images(
+            image_prompts, 
+            num_images=1  # 1 image per prompt
+        )
+        return image_prompts, generated_images
+    
+    def _build_crew(self, tasks: list) -> Crew:
+        """Create a sequential crew that runs the given tasks with their agents"""
+        return Crew(
+            agents=[task.agent for task in tasks],
+            tasks=tasks,
+            process=Process.sequential,
+            verbose=True
+        )
+    
+    def _task_cache_key(self, role: str, describe: Callable[[str], str]) -> str:
+        """Build a cache key from the agent role and the unformatted task description template"""
+        template = describe("{topic}")
+        template_hash = hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+        return f"{role}:{template_hash}"
+    
+    def _adapt_cached_output(self, role: str, describe: Callable[[str], str], topic: str, topic_embedding) -> Optional[str]:
+        """Return a cached output of this task adapted to the topic, or None on a cache miss"""
+        cached = self.task_cache.lookup(self._task_cache_key(role, describe), topic_embedding)
+        if cached is None:
+            return None
+        
+        cached_topic, cached_output = cached
+        print(f"Adapting cached '{role}' output from similar topic: '{cached_topic}'")
+        return adapt_cached_output(cached_output, cached_topic, topic, role)
+    
+    def _cache_task_output(self, role: str, describe: Callable[[str], str], topic: str, topic_embedding, output: str):
+        """Store a freshly generated task output for reuse on similar topics"""
+        self.task_cache.store(self._task_cache_key(role, describe), topic, topic_embedding, output)
+    
     def _parse_image_prompts(self, image_prompts_result: str, topic: str) -> list:
         """Parse image prompts from the agent output, with fallbacks using topic"""
-        # This is a simple parser - in practice, you might want more sophisticated parsing
-        lines = image_prompts_result.split('\n')
-        prompts = []
-        
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('#') and len(line) > 20:  # Basic filtering
-                # Remove numbering and bullet points
-                clean_line = line.lstrip('0123456789.-• ').strip()
-                if clean_line:
-                    prompts.append(clean_line)
-        
+        # This is a simple parser - in practice, you might want more sophisticated parsing.
+        # One regex pass strips bullets/numbering; lines of 20 characters or fewer and
+        # markdown headings are skipped.
+        prompts = [
+            match.group('body').strip()
+            for match in _PROMPT_RE.finditer(image_prompts_result)
+            if len(match.group(0).strip()) > 20 and not match.group('body').startswith('#')
+        ]
+        
+        # Drop repeated prompts (ignoring case and whitespace) so duplicate images aren't paid for
+        seen = set()
+        unique_prompts = []
+        for prompt in prompts:
+            normalized = _WHITESPACE_RE.sub(' ', prompt.lower().strip())
+            if normalized not in seen:
+                seen.add(normalized)
+                unique_prompts.append(prompt)
+        prompts = unique_prompts
+        
+        return self._pad_image_prompts(prompts, topic)
+    
+    def _pad_image_prompts(self, prompts: list, topic: str) -> list:
+        """Return exactly 3 prompts, filling any gap with generic prompts about the topic"""
         # If we don't have enough prompts, create some fallbacks
         if len(prompts) < 3:
-            prompts.extend([
+            prompts = prompts + [
                 f"Professional Instagram post about {topic}, modern design, high quality",
                 f"Engaging social media visual for {topic}, vibrant colors, square format",
                 f"Creative illustration representing {topic}, clean background, Instagram ready"
-            ])
+            ]
         
         return prompts[:3]  # Return max 3 prompts
     
@@ -144,46 +319,34 @@ class InstagramContentCrew:
         """Extract short caption from the content"""
         # Look for patterns that indicate short caption
         lines = content.split('\n')
-        for line in lines:
-            if 'SHORT CAPTION' in line.upper() or 'SHORT:' in line.upper():
+        for idx, line in enumerate(lines):
+            if _SHORT_CAPTION_RE.search(line):
                 # Find the next non-empty line
-                idx = lines.index(line)
-                for i in range(idx + 1, len(lines)):
-                    if lines[i].strip():
-                        return lines[i].strip()
-        return "Check the full content for short caption"
+                for next_line in lines[idx + 1:]:
+                    if next_line.strip():
+                        return next_line.strip()
+        return _SHORT_CAPTION_FALLBACK
     
     def _extract_long_caption(self, content: str) -> str:
         """Extract long caption from the content"""
         # Look for patterns that indicate long caption
         lines = content.split('\n')
-        for line in lines:
-            if 'LONG CAPTION' in line.upper() or 'LONG:' in line.upper():
-                # Find the next non-empty line
-                idx = lines.index(line)
+        for idx, line in enumerate(lines):
+            if _LONG_CAPTION_RE.search(line):
+                # Collect the following lines up to the hashtag block
                 caption_lines = []
-                for i in range(idx + 1, len(lines)):
-                    if lines[i].strip() and not lines[i].strip().startswith('#'):
-                        caption_lines.append(lines[i].strip())
-                    elif lines[i].strip().startswith('#') and caption_lines:
+                for next_line in lines[idx + 1:]:
+                    stripped = next_line.strip()
+                    if stripped and not stripped.startswith('#'):
+                        caption_lines.append(stripped)
+                    elif stripped.startswith('#') and caption_lines:
                         break
                 return '\n'.join(caption_lines)
         return content  # Return full content if we can't parse
     
     def _extract_hashtags(self, content: str) -> list:
         """Extract hashtags from the content"""
-        hashtags = []
-        lines = content.split('\n')
-        
-        for line in lines:
-            if '#' in line:
-                # Extract hashtags from the line
-                words = line.split()
-                for word in words:
-                    if word.startswith('#') and len(word) > 1:
-                        hashtags.append(word)
-        
-        return hashtags[:30]  # Limit to 30 hashtags
+        return _HASHTAG_RE.findall(content)[:30]  # Limit to 30 hashtags
     
     def _save_result(self, result: dict, topic: str):
         """Save the result to a JSON file"""
@@ -196,9 +359,20 @@ class InstagramContentCrew:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"results/instagram_content_{safe_topic}_{timestamp}.json"
         
-        # Save to file
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        # Serialize in one shot and write it with a single unbuffered call to a temporary
+        # file, then rename it into place so a crash never leaves a partial result behind
+        data = orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        tmp_path = Path(f"{filename}.tmp")
+        try:
+            with open(tmp_path, 'wb', buffering=0) as f:
+                # A raw write may be partial, so keep writing until every byte is out
+                view = memoryview(data)
+                while view:
+                    view = view[f.write(view):]
+            tmp_path.replace(filename)
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
         
         print(f"Results saved to: {filename}")
 
@@ -0,0 +1,144 @@
+"""
+Semantic caching of content packages keyed by topic embeddings
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+CACHE_DB_PATH = os.path.join("cache", "semantic_cache.db")
+
+_embedding_model = None
+_embedding_lock = threading.Lock()
+
+def embed_text(text: str) -> np.ndarray:
+    """Embed text with the local MiniLM model as a unit-length float32 vector"""
+    global _embedding_model
+    with _embedding_lock:
+        if _embedding_model is None:
+            # Loading the model is slow, so only pay for it once it is actually needed
+            from sentence_transformers import SentenceTransformer
+            _embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+
+    embedding = _embedding_model.encode(text, normalize_embeddings=True)
+    return np.asarray(embedding, dtype=np.float32)
+
+def _most_similar(embeddings: List[bytes], embedding: np.ndarray) -> Tuple[int, float]:
+    """Return the index and cosine similarity of the closest stored embedding"""
+    # Embeddings are normalized, so a flat inner-product search is a cosine search
+    matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for blob in embeddings])
+    similarities = matrix @ embedding
+    best = int(np.argmax(similarities))
+    return best, float(similarities[best])
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+def _get_connection(db_path: str) -> Tuple[sqlite3.Connection, threading.Lock]:
+    """Return the connection and lock shared by all caches stored in a database file"""
+    path = os.path.abspath(db_path)
+    with _connections_lock:
+        if path not in _connections:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _connections[path] = (sqlite3.connect(path, check_same_thread=False), threading.Lock())
+        return _connections[path]
+
+class _SQLiteCache:
+    """Base class for embedding caches stored in a shared SQLite database"""
+
+    # CREATE statements run once when a cache is opened
+    _schema: Tuple[str, ...] = ()
+
+    def __init__(self, db_path: str, threshold: float):
+        self.threshold = threshold
+
+        self._conn, self._lock = _get_connection(db_path)
+        with self._lock:
+            for statement in self._schema:
+                self._conn.execute(statement)
+            self._conn.commit()
+
+class SemanticCache(_SQLiteCache):
+    """Caches final content packages so semantically similar topics skip the crew run"""
+
+    _schema = (
+        """CREATE TABLE IF NOT EXISTS content_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            result TEXT NOT NULL
+        )""",
+    )
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, threshold: float = 0.92):
+        super().__init__(db_path, threshold)
+
+    def lookup(self, embedding: np.ndarray) -> Optional[dict]:
+        """Return the cached result for the most similar topic, if it clears the threshold"""
+        with self._lock:
+            rows = self._conn.execute("SELECT embedding, result FROM content_cache").fetchall()
+
+        if not rows:
+            return None
+
+        best, similarity = _most_similar([row[0] for row in rows], embedding)
+        if similarity <= self.threshold:
+            return None
+
+        return json.loads(rows[best][1])
+
+    def store(self, topic: str, embedding: np.ndarray, result: dict):
+        """Persist a content package under the embedding of its topic"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO content_cache (topic, embedding, result) VALUES (?, ?, ?)",
+                (topic, embedding.astype(np.float32).tobytes(), json.dumps(result, ensure_ascii=False))
+            )
+            self._conn.commit()
+
+class TaskCache(_SQLiteCache):
+    """Caches individual task outputs so near-miss topics can adapt them instead of re-running agents"""
+
+    _schema = (
+        """CREATE TABLE IF NOT EXISTS task_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_key TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            output TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_task_cache_key ON task_cache (task_key)"
+    )
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, threshold: float = 0.85):
+        super().__init__(db_path, threshold)
+
+    def lookup(self, task_key: str, embedding: np.ndarray) -> Optional[Tuple[str, str]]:
+        """Return (topic, output) of the most similar cached run of this task, if it clears the threshold"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT embedding, topic, output FROM task_cache WHERE task_key = ?",
+                (task_key,)
+            ).fetchall()
+
+        if not rows:
+            return None
+
+        best, similarity = _most_similar([row[0] for row in rows], embedding)
+        if similarity <= self.threshold:
+            return None
+
+        return rows[best][1], rows[best][2]
+
+    def store(self, task_key: str, topic: str, embedding: np.ndarray, output: str):
+        """Persist a task output under the embedding of its topic"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO task_cache (task_key, topic, embedding, output) VALUES (?, ?, ?, ?)",
+                (task_key, topic, embedding.astype(np.float32).tobytes(), output)
+            )
+            self._conn.commit()
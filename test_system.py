@@ -26,7 +26,8 @@ def test_system():
         
         # Run content creation
         print(f"Testing with topic: '{test_topic}'")
-        result = crew.create_content(test_topic, save_images=False)  # Don't save images for test
+        # Fast mode uses a single LLM call instead of the full crew; the test leaves no files behind
+        result = crew.create_content(test_topic, save_images=False, fast_mode=True, save_result=False)
         
         # Display results
         print("\nTest completed successfully!")
@@ -48,5 +49,38 @@ def test_system():
         print("2. Ensure you have internet connection")
         print("3. Verify all dependencies are installed")
 
+def test_parsers():
+    """Check the output parsers on sample agent output (no API calls)"""
+    crew = InstagramContentCrew()
+    
+    # Numbering and bullets are stripped, short lines and markdown headings are skipped
+    image_prompts_result = """## Image Prompts
+    1 - A neon-lit robot painting a sunrise over a city
+    - 1. Nested prompt with a bullet and a number
+    2) Close-up of a charging port glowing blue
+    short line
+    3D render of a battery pack in an exploded view
+    """
+    assert crew._parse_image_prompts(image_prompts_result, "Robots") == [
+        "A neon-lit robot painting a sunrise over a city",
+        "Nested prompt with a bullet and a number",
+        "Close-up of a charging port glowing blue",
+    ]
+    
+    # Repeated prompts (ignoring case and whitespace) are dropped and fallbacks fill the gap
+    duplicated = """1. A futuristic electric car at night
+    2. a futuristic   ELECTRIC car at night
+    """
+    prompts = crew._parse_image_prompts(duplicated, "Electric Cars")
+    assert prompts[0] == "A futuristic electric car at night"
+    assert len(prompts) == 3 and len({p.lower() for p in prompts}) == 3
+    
+    # Hashtags stop at punctuation, and bare markdown '##' markers are not hashtags
+    review_result = "## Hashtags\n#AI, #Coding! #DevLife\nNo tags here"
+    assert crew._extract_hashtags(review_result) == ["#AI", "#Coding", "#DevLife"]
+    
+    print("Parser tests passed")
+
 if __name__ == "__main__":
+    test_parsers()
     test_system()